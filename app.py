@@ -1,8 +1,10 @@
+import hashlib
 import streamlit as st
 import pandas as pd
 import numpy as np
 import requests
-from io import StringIO
+from io import BytesIO
+from pyarrow import ArrowInvalid
 
 # -----------------------------
 # PAGE SETUP
@@ -40,69 +42,132 @@ current_quarter = st.sidebar.selectbox(
 # -----------------------------
 # HELPERS
 # -----------------------------
+# Returns the parsed CSV plus a digest of the response body, so callers
+# can tell when a refetch after the ttl brought in different salaries
+@st.cache_data(ttl=300, show_spinner=False)
 def load_dk_csv(url):
     headers = {"User-Agent": "Mozilla/5.0"}
     r = requests.get(url, headers=headers)
     r.raise_for_status()
-    return pd.read_csv(StringIO(r.text))
+    digest = hashlib.blake2b(r.content, digest_size=8).hexdigest()
+    return pd.read_csv(BytesIO(r.content), engine="pyarrow"), digest
 
-def dk_points(row):
+# Uploads are re-sent on every rerun; cache the parse on the raw bytes.
+# The cache is shared by every session, so bound it
+@st.cache_data(max_entries=32, show_spinner=False)
+def read_uploaded_csv(data):
+    # C engine: it pads ragged rows with NaN where pyarrow would raise
+    return pd.read_csv(BytesIO(data))
+
+DK_STAT_COLS = ["PTS", "REB", "AST", "STL", "BLK", "3PM", "TOV"]
+
+def dk_points(df):
+    # Missing stat columns score as 0
+    s = df.reindex(columns=DK_STAT_COLS, fill_value=0)
     return (
-        row.get("PTS", 0)
-        + row.get("REB", 0) * 1.25
-        + row.get("AST", 0) * 1.5
-        + row.get("STL", 0) * 2
-        + row.get("BLK", 0) * 2
-        + row.get("3PM", 0) * 0.5
-        - row.get("TOV", 0) * 0.5
+        s["PTS"]
+        + s["REB"] * 1.25
+        + s["AST"] * 1.5
+        + s["STL"] * 2
+        + s["BLK"] * 2
+        + s["3PM"] * 0.5
+        - s["TOV"] * 0.5
     )
 
+# Box score counts fit in int16 and fractional points in float32
+def downcast(df, cols, int_dtype="int16"):
+    dtypes = {}
+    for c in cols:
+        if c not in df.columns:
+            continue
+        if pd.api.types.is_integer_dtype(df[c]):
+            dtypes[c] = int_dtype
+        elif pd.api.types.is_float_dtype(df[c]):
+            dtypes[c] = "float32"
+    return df.astype(dtypes)
+
 # Minutes remaining estimate
 def minutes_remaining(q):
     return max(0, (4 - q) * 12)
 
+# Keep a parsed frame in session_state until its input bytes change. The
+# bytes are still hashed each rerun, but this skips hashing DataFrame
+# arguments (the salaries frame) and unpickling the cache_data copy
+def session_frame(name, data, build, extra_key=""):
+    key = hashlib.blake2b(data, digest_size=8).hexdigest() + extra_key
+    if st.session_state.get(f"{name}_key") != key:
+        st.session_state[name] = build(data)
+        st.session_state[f"{name}_key"] = key
+    return st.session_state[name]
+
+# Stats + salaries -> per-player DK points and value; cached so widget
+# changes (e.g. the quarter selectbox) skip the whole pipeline
+@st.cache_data(max_entries=16, show_spinner=False)
+def build_player_df(boxscore_bytes, salaries):
+    stats = read_uploaded_csv(boxscore_bytes)
+
+    # Ensure quarter columns exist
+    for q in ["Q1", "Q2", "Q3", "Q4"]:
+        if q not in stats.columns:
+            stats[q] = 0
+
+    stats = downcast(stats, DK_STAT_COLS + ["Q1", "Q2", "Q3", "Q4"])
+    stats["DK_POINTS"] = dk_points(stats).to_numpy(dtype="float32")
+    salaries = downcast(salaries[["PLAYER", "Salary"]], ["Salary"], int_dtype="int32")
+
+    # Shared categories let the merge (and later lineup join) hash int codes
+    players = pd.concat([salaries["PLAYER"], stats["PLAYER"]]).dropna().unique()
+    player_dtype = pd.CategoricalDtype(categories=players)
+    stats["PLAYER"] = stats["PLAYER"].astype(player_dtype)
+    salaries = salaries.astype({"PLAYER": player_dtype})
+
+    # Only the columns the views use go through the join
+    stats = stats[["PLAYER", "DK_POINTS", "Q1", "Q2", "Q3", "Q4"]]
+
+    player_df = stats.merge(
+        salaries,
+        on="PLAYER",
+        how="left"
+    )
+
+    player_df["VALUE"] = player_df["DK_POINTS"] / (player_df["Salary"] / 1000)
+    return player_df
+
 # -----------------------------
 # LOAD DATA
 # -----------------------------
 salaries = None
 if dk_salary_url:
     try:
-        salaries = load_dk_csv(dk_salary_url)
+        salaries, salaries_key = load_dk_csv(dk_salary_url)
         st.sidebar.success("DK Salaries Loaded")
-    except:
-        st.sidebar.error("Failed to load DK salary CSV")
+    except (requests.RequestException, pd.errors.ParserError, ArrowInvalid) as e:
+        st.sidebar.error(f"Failed to load DK salary CSV: {e}")
 
 if not (salaries is not None and dk_entries_file and boxscore_file):
     st.info("👈 Load DK salary URL, DK entries CSV, and boxscore CSV to begin")
     st.stop()
 
-entries = pd.read_csv(dk_entries_file)
-stats = pd.read_csv(boxscore_file)
+entries = session_frame("entries", dk_entries_file.getvalue(), read_uploaded_csv)
 
-# Ensure quarter columns exist
-for q in ["Q1", "Q2", "Q3", "Q4"]:
-    if q not in stats.columns:
-        stats[q] = 0
-
-stats["DK_POINTS"] = stats.apply(dk_points, axis=1)
-
-player_df = stats.merge(
-    salaries[["PLAYER", "Salary"]],
-    on="PLAYER",
-    how="left"
+player_df = session_frame(
+    "player_df",
+    boxscore_file.getvalue(),
+    lambda data: build_player_df(data, salaries),
+    extra_key=salaries_key,
 )
 
-player_df["VALUE"] = player_df["DK_POINTS"] / (player_df["Salary"] / 1000)
-
 # -----------------------------
 # PLAYER VIEW
 # -----------------------------
 st.subheader("📊 Player DFS Output")
 
+# Salary is NaN for players missing from the DK file, hence nullable Int32
 st.dataframe(
     player_df[
         ["PLAYER", "DK_POINTS", "Salary", "VALUE", "Q1", "Q2", "Q3", "Q4"]
-    ].sort_values("DK_POINTS", ascending=False),
+    ].astype({"Salary": "Int32", "VALUE": "float32"})
+    .sort_values("DK_POINTS", ascending=False),
     use_container_width=True
 )
 
@@ -111,53 +176,53 @@ st.dataframe(
 # -----------------------------
 st.subheader("🧠 Lineup-Level Impact View (PopcornMachine Style)")
 
-lineups = []
-
 lineup_cols = [c for c in entries.columns if "Player" in c]
+score_cols = ["DK_POINTS", "Salary", "Q1", "Q2", "Q3", "Q4"]
+
+# One row per (lineup, player), joined to player stats and summed per lineup
+long = (
+    entries[lineup_cols]
+    .reset_index()
+    .melt(id_vars="index", value_name="PLAYER")
+    .astype({"PLAYER": player_df["PLAYER"].dtype})
+    .dropna(subset=["PLAYER"])
+)
+# Project before indexing so unused player_df columns stay out of the lookup
+player_idx = player_df[score_cols].set_axis(player_df["PLAYER"])
+joined = long.merge(player_idx, left_on="PLAYER", right_index=True, how="inner")
+agg = joined.groupby("index")[score_cols].sum()
+
+total = agg["DK_POINTS"]
+salary = agg["Salary"]
+early = agg["Q1"] + agg["Q2"]
+late = agg["Q3"] + agg["Q4"]
+
+mins_left = minutes_remaining(current_quarter)
+
+# Divide-by-zero guards, computed once on the raw arrays
+denom_total = np.maximum(total.to_numpy(), 1)
+denom_salary = np.maximum(salary.to_numpy() / 1000, 1)
+
+swap_urgency = (
+    (late / denom_total) *
+    (mins_left / 48) *
+    (total / denom_salary)
+)
 
-for i, row in entries.iterrows():
-    lineup_players = row[lineup_cols].dropna().tolist()
-
-    lineup_stats = player_df[player_df["PLAYER"].isin(lineup_players)]
-
-    if lineup_stats.empty:
-        continue
-
-    q1 = lineup_stats["Q1"].sum()
-    q2 = lineup_stats["Q2"].sum()
-    q3 = lineup_stats["Q3"].sum()
-    q4 = lineup_stats["Q4"].sum()
-
-    total = lineup_stats["DK_POINTS"].sum()
-    salary = lineup_stats["Salary"].sum()
-
-    early = q1 + q2
-    late = q3 + q4
-
-    mins_left = minutes_remaining(current_quarter)
-
-    swap_urgency = (
-        (late / max(total, 1)) *
-        (mins_left / 48) *
-        (total / max(salary / 1000, 1))
-    )
-
-    lineups.append({
-        "Lineup #": i + 1,
-        "DK Points": round(total, 2),
-        "Salary": int(salary),
-        "Value": round(total / (salary / 1000), 2),
-        "Q1": round(q1, 2),
-        "Q2": round(q2, 2),
-        "Q3": round(q3, 2),
-        "Q4": round(q4, 2),
-        "Early (Q1+Q2)": round(early, 2),
-        "Late (Q3+Q4)": round(late, 2),
-        "Minutes Left": mins_left,
-        "Swap Urgency": round(swap_urgency, 3),
-    })
-
-lineup_df = pd.DataFrame(lineups)
+lineup_df = pd.DataFrame({
+    "Lineup #": agg.index + 1,
+    "DK Points": total.round(2),
+    "Salary": salary.astype("int32"),
+    "Value": (total / (salary / 1000)).round(2),
+    "Q1": agg["Q1"].round(2),
+    "Q2": agg["Q2"].round(2),
+    "Q3": agg["Q3"].round(2),
+    "Q4": agg["Q4"].round(2),
+    "Early (Q1+Q2)": early.round(2),
+    "Late (Q3+Q4)": late.round(2),
+    "Minutes Left": mins_left,
+    "Swap Urgency": swap_urgency.round(3),
+}).sort_values("Swap Urgency", ascending=False, kind="stable", ignore_index=True)
 
 # -----------------------------
 # POPCORN MACHINE BAR VIEW
@@ -165,7 +230,7 @@ lineup_df = pd.DataFrame(lineups)
 st.subheader("🍿 Game Flow Bars (Q1 → Q4)")
 
 st.dataframe(
-    lineup_df.sort_values("Swap Urgency", ascending=False),
+    lineup_df,
     use_container_width=True
 )
 